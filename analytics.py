@@ -0,0 +1,149 @@
+import numpy as np
+
+# Runden außerhalb von [Q1 - k*IQR, Q3 + k*IQR] gelten als Ausreißer (Outlap, Boxenstopp, Abflug)
+IQR_FACTOR = 1.5
+# Erst ab so vielen Runden sind die Quartile aussagekräftig genug zum Filtern
+MIN_LAPS_FOR_FILTER = 4
+ROLLING_WINDOW = 5
+
+
+class LapMatrix:
+    """Rundenzeiten aller Fahrer als Matrix (Fahrer x Runde), aufgefüllt mit NaN"""
+
+    def __init__(self, driver_ids, driver_names, times, pb_counts):
+        self.driver_ids = driver_ids
+        self.driver_names = driver_names
+        self.times = times
+        self.pb_counts = pb_counts
+        self.counts = np.count_nonzero(~np.isnan(times), axis=1)
+
+    def __len__(self):
+        return len(self.driver_ids)
+
+
+def load_lap_matrix(conn, driver_id=None):
+    """Lädt alle gültigen Rundenzeiten mit einer einzigen Abfrage"""
+    where_clause = "WHERE laptime_raw IS NOT NULL AND laptime_raw > 0"
+    params = ()
+    if driver_id:
+        where_clause += " AND driver_id = ?"
+        params = (driver_id,)
+
+    rows = conn.execute(f'''
+        SELECT driver_id, driver_name, laptime_raw, lap_pb
+        FROM lap_updates
+        {where_clause}
+        ORDER BY driver_id, timestamp, id
+    ''', params).fetchall()
+
+    if not rows:
+        return LapMatrix([], [], np.empty((0, 0)), np.empty(0, dtype=int))
+
+    ids, names, laptimes, pbs = zip(*rows)
+    ids = np.array(ids, dtype=object)
+    laptimes = np.array(laptimes, dtype=float)
+    pbs = np.array([bool(pb) for pb in pbs])
+
+    # Gruppengrenzen in der nach driver_id sortierten Liste
+    starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+    counts = np.diff(np.append(starts, len(ids)))
+    group = np.repeat(np.arange(len(starts)), counts)
+    column = np.arange(len(ids)) - np.repeat(starts, counts)
+
+    times = np.full((len(starts), counts.max()), np.nan)
+    times[group, column] = laptimes
+
+    # Letzter bekannter Name pro Fahrer
+    last = starts + counts - 1
+    return LapMatrix(
+        list(ids[starts]),
+        [names[i] for i in last],
+        times,
+        np.bincount(group, weights=pbs, minlength=len(starts)).astype(int)
+    )
+
+
+def outlier_mask(times, factor=IQR_FACTOR, min_laps=MIN_LAPS_FOR_FILTER):
+    """True für Runden innerhalb der IQR-Grenzen (Fahrer mit wenigen Runden bleiben ungefiltert)"""
+    valid = ~np.isnan(times)
+    if times.size == 0:
+        return valid
+    with np.errstate(invalid='ignore'):
+        q1, q3 = np.nanpercentile(times, [25, 75], axis=1)
+        iqr = q3 - q1
+        inside = (times >= (q1 - factor * iqr)[:, None]) & (times <= (q3 + factor * iqr)[:, None])
+    filterable = (np.count_nonzero(valid, axis=1) >= min_laps)[:, None]
+    return np.where(filterable, inside, valid)
+
+
+def _linear_slope(values):
+    """Steigung der Regressionsgeraden pro Zeile über die Rundennummer, NaN werden ignoriert"""
+    mask = ~np.isnan(values)
+    x = np.where(mask, np.arange(values.shape[1], dtype=float)[None, :], 0.0)
+    y = np.where(mask, values, 0.0)
+    n = mask.sum(axis=1)
+    sx = x.sum(axis=1)
+    denominator = n * (x * x).sum(axis=1) - sx * sx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, (n * (x * y).sum(axis=1) - sx * y.sum(axis=1)) / denominator, 0.0)
+
+
+def _rolling_last(values, window=ROLLING_WINDOW):
+    """Gleitender Durchschnitt der letzten `window` gültigen Runden pro Fahrer"""
+    valid = ~np.isnan(values)
+    # Gültige Werte nach vorne sortieren, die letzten n liegen dann bei [count - n, count)
+    packed = np.take_along_axis(values, np.argsort(~valid, axis=1, kind='stable'), axis=1)
+    counts = valid.sum(axis=1)
+    columns = np.arange(values.shape[1])[None, :]
+    in_window = (columns >= (counts - window)[:, None]) & (columns < counts[:, None])
+    sums = np.where(in_window, packed, 0.0).sum(axis=1)
+    sizes = in_window.sum(axis=1)
+    result = np.full(values.shape[0], np.nan)
+    np.divide(sums, sizes, out=result, where=sizes > 0)
+    return result
+
+
+def lap_statistics(matrix):
+    """Kennzahlen für alle Fahrer in einem Durchlauf, Ausreißer sind herausgefiltert"""
+    times = matrix.times
+    if len(matrix) == 0:
+        return []
+
+    mask = outlier_mask(times)
+    clean = np.where(mask, times, np.nan)
+    clean_counts = mask.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(clean, axis=1)
+        p10, median, p90 = np.nanpercentile(clean, [10, 50, 90], axis=1)
+    # Nur Zeilen mit mindestens zwei Runden, sonst warnt nanstd (ddof=1) trotz errstate
+    std = np.zeros(len(matrix))
+    multiple = clean_counts > 1
+    if multiple.any():
+        std[multiple] = np.nanstd(clean[multiple], axis=1, ddof=1)
+    slope = _linear_slope(clean)
+    rolling = _rolling_last(clean)
+
+    results = []
+    for i, driver_id in enumerate(matrix.driver_ids):
+        valid = times[i, :matrix.counts[i]]
+        results.append({
+            'driver_id': driver_id,
+            'driver_name': matrix.driver_names[i],
+            'total_laps': int(matrix.counts[i]),
+            'clean_laps': int(clean_counts[i]),
+            'outliers': int(matrix.counts[i] - clean_counts[i]),
+            'personal_bests': int(matrix.pb_counts[i]),
+            'best_time': float(np.nanmin(valid)),
+            'worst_time': float(np.nanmax(valid)),
+            'avg_time': float(np.nanmean(valid)),
+            'clean_avg_time': float(mean[i]),
+            'stdev': float(std[i]),
+            'p10': float(p10[i]),
+            'median': float(median[i]),
+            'p90': float(p90[i]),
+            'rolling_avg': float(rolling[i]),
+            # Positiv = schneller geworden (ms über den gesamten Stint laut Regressionsgerade)
+            'trend': float(-slope[i] * max(clean_counts[i] - 1, 0))
+        })
+    return results
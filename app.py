@@ -1,44 +1,109 @@
+from dotenv import load_dotenv
+
+# Load environment variables (vor async_server, damit ASYNC_MODE aus .env greift)
+load_dotenv()
+
+import async_server
+from async_server import ASYNC_MODE, BackgroundQueue, run_blocking
+
+# Green-Thread Patching muss vor allen anderen Imports passieren
+async_server.monkey_patch()
+
 from flask import Flask, render_template, request, jsonify, make_response, flash, redirect, url_for
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import datetime
-import json
+import serializer
 import csv
 import io
 import os
-from dotenv import load_dotenv
-import dropbox
-from dropbox.exceptions import ApiError, AuthError
 import threading
+import tempfile
+from jinja2 import FileSystemBytecodeCache
 import time
+import logging
+from logging_config import setup_logging, LazyJson
+from database import RaceDatabase
+from message_bus import create_client_manager
+from http_cache import HttpCache
+from ingest_guard import IngestGuard, event_key as get_event_key
+import wire_format
+from timing import Leaderboard, SectorTracker, session_mode
 
-# Load environment variables
-load_dotenv()
+# Logging
+setup_logging(*async_server.native_primitives())
+logger = logging.getLogger('smartrace.app')
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'smartrace-dashboard-secret-key'
+app.json = serializer.JSONProvider(app)
+
+# Kompilierte Templates zwischen Neustarts wiederverwenden
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'smartrace-jinja'))
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+# gzip/brotli, JSON-Snapshots mit ETag und Fingerprinting für static/
+http_cache = HttpCache(app)
+
+# Horizontale Skalierung: ein Ingest-Worker schreibt, beliebig viele Viewer-Worker verteilen
+# WORKER_ROLE = all (Einzelbetrieb) | ingest | viewer
+WORKER_ROLE = os.getenv('WORKER_ROLE', 'all').lower()
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+PORT = int(os.getenv('PORT', 5000))
 
 # Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+client_manager = create_client_manager(SOCKETIO_MESSAGE_QUEUE)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, client_manager=client_manager,
+                    json=serializer, http_compression=True, compression_threshold=512)
+
+# Socket.IO Topics (Rooms) - Clients bekommen nur, was sie abonniert haben
+# race = kompletter race_update wie bisher, driver:<id> = Runden eines Fahrers
+TOPICS = ('race', 'leaderboard', 'session', 'laps', 'ideal_lap')
+
+# Database + Hintergrund-Queues (SQLite-Schreibzugriffe und Uploads blockieren keine Requests)
+db = RaceDatabase()
+ingest_queue = BackgroundQueue('ingest', db.insert_lap_update).start()
+
+# Rate Limit pro Absender, Duplikat-Erkennung und Load Shedding vor /api/smartrace
+ingest_guard = IngestGuard()
+upload_queue = BackgroundQueue('upload', lambda job: job(), maxsize=10).start()
 
 # Dropbox configuration
 DROPBOX_ACCESS_TOKEN = os.getenv('DROPBOX_ACCESS_TOKEN')
 DROPBOX_FOLDER = os.getenv('DROPBOX_FOLDER', '/SmartRace_Data')
 DROPBOX_ENABLED = os.getenv('DROPBOX_ENABLED', 'false').lower() == 'true'
 
-# Initialize Dropbox client
+# Dropbox client - wird nach dem Serverstart im Hintergrund verbunden (connect_dropbox)
 dbx = None
-if DROPBOX_ENABLED and DROPBOX_ACCESS_TOKEN:
+
+def connect_dropbox():
+    """Import und Verbindungsaufbau zu Dropbox, blockiert den Serverstart nicht"""
+    global dbx
+    
     try:
-        dbx = dropbox.Dropbox(DROPBOX_ACCESS_TOKEN)
-        dbx.users_get_current_account()
-        print("✅ Dropbox connection established")
+        import dropbox
+        from dropbox.exceptions import AuthError
+    except ImportError as e:
+        logger.error("❌ Dropbox SDK not available: %s", e)
+        return False
+    
+    try:
+        client = dropbox.Dropbox(DROPBOX_ACCESS_TOKEN)
+        client.users_get_current_account()
+        dbx = client
+        logger.info("✅ Dropbox connection established")
+        return True
     except AuthError:
-        print("❌ Dropbox authentication failed")
-        dbx = None
+        logger.error("❌ Dropbox authentication failed")
     except Exception as e:
-        print(f"❌ Dropbox initialization error: {e}")
-        dbx = None
+        logger.error("❌ Dropbox initialization error: %s", e)
+    return False
+
+def start_dropbox():
+    """Verbindet Dropbox im Thread-Pool und startet danach das Auto-Backup"""
+    if run_blocking(connect_dropbox) and WORKER_ROLE != 'viewer':
+        start_auto_backup()
 
 # Global data storage
 race_data = {
@@ -67,12 +132,24 @@ track_data = {
 lap_history = {}
 car_database = {}
 
+# Serverseitige Rangliste - Positionen und Gaps kommen von hier, nicht von SmartRace
+leaderboard = Leaderboard(session_mode(race_data['session_info']['session_type']))
+
+# Theoretische Bestzeiten aus den besten Sektoren
+sector_tracker = SectorTracker(track_data['track_data']['sectors'])
+
+# Rangliste, Sektoren und race_data werden von parallelen Requests (threading) geändert
+state_lock = threading.RLock()
+
 # Dropbox helper functions
 def upload_to_dropbox(file_content, filename, folder=None):
     """Upload file content to Dropbox"""
     if not dbx:
         return False, "Dropbox not configured"
     
+    from dropbox.exceptions import ApiError
+    from dropbox.files import WriteMode
+    
     try:
         dropbox_path = f"{DROPBOX_FOLDER}/{folder}" if folder else DROPBOX_FOLDER
         full_path = f"{dropbox_path}/{filename}"
@@ -90,7 +167,7 @@ def upload_to_dropbox(file_content, filename, folder=None):
         dbx.files_upload(
             file_content.encode('utf-8') if isinstance(file_content, str) else file_content,
             full_path,
-            mode=dropbox.files.WriteMode('overwrite'),
+            mode=WriteMode('overwrite'),
             autorename=True
         )
         
@@ -120,17 +197,17 @@ def auto_backup_session():
         success, msg = upload_to_dropbox(csv_content, "race_results.csv", folder_name)
         
         if success:
-            print(f"✅ Auto-backup: Race results uploaded")
+            logger.info("✅ Auto-backup: Race results uploaded")
         
         # Export lap history
         lap_csv_content = generate_lap_history_csv()
         success, msg = upload_to_dropbox(lap_csv_content, "lap_history.csv", folder_name)
         
         if success:
-            print(f"✅ Auto-backup: Lap history uploaded")
+            logger.info("✅ Auto-backup: Lap history uploaded")
         
         # Export session info as JSON
-        session_json = json.dumps({
+        session_json = serializer.dumps({
             'race_data': race_data,
             'track_data': track_data,
             'lap_history': lap_history,
@@ -141,10 +218,10 @@ def auto_backup_session():
         success, msg = upload_to_dropbox(session_json, "session_data.json", folder_name)
         
         if success:
-            print(f"✅ Auto-backup: Session data uploaded")
+            logger.info("✅ Auto-backup: Session data uploaded")
     
     except Exception as e:
-        print(f"❌ Auto-backup failed: {e}")
+        logger.exception("❌ Auto-backup failed: %s", e)
 
 def generate_race_results_csv():
     """Generate CSV content for race results"""
@@ -157,11 +234,12 @@ def generate_race_results_csv():
         'Total Time', 'Best Lap', 'Total Laps', 'Gap', 'Status'
     ])
     
-    # Sort drivers by position or best lap
-    sorted_drivers = sorted(
-        race_data['drivers'].items(), 
-        key=lambda x: x[1].get('position', 999)
+    # Reihenfolge aus der Rangliste (Viewer-Worker haben nur die gespiegelten Positionen)
+    order = leaderboard.order() or sorted(
+        race_data['drivers'], 
+        key=lambda driver_id: race_data['drivers'][driver_id].get('position') or 999
     )
+    sorted_drivers = [(driver_id, race_data['drivers'][driver_id]) for driver_id in order if driver_id in race_data['drivers']]
     
     for driver_id, driver_data in sorted_drivers:
         writer.writerow([
@@ -213,7 +291,7 @@ def index():
                              dropbox_enabled=DROPBOX_ENABLED,
                              total_drivers=len(race_data['drivers']))
     except Exception as e:
-        print(f"ERROR in index route: {e}")
+        logger.exception("Error in index route: %s", e)
         return jsonify({"error": f"Homepage error: {e}"}), 500
 
 @app.route('/api/health')
@@ -225,19 +303,21 @@ def health_check():
             "timestamp": datetime.datetime.now().isoformat(),
             "server": "SmartRace Dashboard",
             "dropbox_enabled": DROPBOX_ENABLED,
-            "total_drivers": len(race_data['drivers'])
+            "total_drivers": len(race_data['drivers']),
+            "ingest": dict(ingest_guard.stats, queued=ingest_queue.qsize())
         })
     except Exception as e:
-        print(f"ERROR in health_check: {e}")
+        logger.exception("Error in health_check: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/race-data')
 def get_race_data():
     """Get race data - KORRIGIERT"""
     try:
-        return jsonify(race_data)
+        with state_lock:
+            return http_cache.json_snapshot('race-data', lambda: app.json.dumps(race_data))
     except Exception as e:
-        print(f"ERROR in get_race_data: {e}")
+        logger.exception("Error in get_race_data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/track-data')
@@ -246,25 +326,71 @@ def get_track_data():
     try:
         return jsonify(track_data)
     except Exception as e:
-        print(f"ERROR in get_track_data: {e}")
+        logger.exception("Error in get_track_data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lap-history')
 def get_lap_history():
     """Get lap history - KORRIGIERT"""
     try:
-        return jsonify(lap_history)
+        with state_lock:
+            return http_cache.json_snapshot('lap-history', lambda: app.json.dumps(lap_history))
+    except Exception as e:
+        logger.exception("Error in get_lap_history: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+def int_arg(name, default=None):
+    """Integer-Parameter aus der Query, ungültige Werte sind ein ValueError (400) statt ignoriert"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r}")
+
+@app.route('/api/laps')
+def browse_laps():
+    """Runden aus der Datenbank blättern (Keyset-Pagination, ohne raw_data per Default)"""
+    try:
+        args = request.args
+        columns = args.get('columns')
+        result = run_blocking(
+            db.browse_laps,
+            limit=max(1, min(int_arg('limit', 50), 500)),
+            before=args.get('cursor'),
+            since=args.get('since'),
+            driver_id=int_arg('driver_id'),
+            car_id=int_arg('car_id'),
+            session=args.get('session'),
+            pb_only=args.get('pb_only', 'false').lower() in ('1', 'true', 'yes'),
+            start=int_arg('start'),
+            end=int_arg('end'),
+            columns=columns.split(',') if columns else None
+        )
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"ERROR in get_lap_history: {e}")
+        logger.exception("Error in browse_laps: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/car-database')
 def get_car_database():
     """Get car database - KORRIGIERT"""
     try:
-        return jsonify(car_database)
+        return http_cache.json_snapshot('car-database', lambda: app.json.dumps(car_database))
     except Exception as e:
-        print(f"ERROR in get_car_database: {e}")
+        logger.exception("Error in get_car_database: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ideal-lap')
+def get_ideal_lap():
+    """Theoretische Bestzeit pro Fahrer und gesamt aus den besten Sektoren"""
+    try:
+        return jsonify(sector_tracker.snapshot())
+    except Exception as e:
+        logger.exception("Error in get_ideal_lap: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/track-info')
@@ -278,7 +404,7 @@ def track_info():
             'layout': 'road_course'
         })
     except Exception as e:
-        print(f"ERROR in track_info: {e}")
+        logger.exception("Error in track_info: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/analysis-data')
@@ -291,7 +417,7 @@ def analysis_data():
             'charts': []
         })
     except Exception as e:
-        print(f"ERROR in analysis_data: {e}")
+        logger.exception("Error in analysis_data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/dropbox/status')
@@ -304,7 +430,7 @@ def dropbox_status():
         if not dbx:
             return jsonify({'enabled': True, 'connected': False, 'message': 'Dropbox not connected'})
         
-        account = dbx.users_get_current_account()
+        account = run_blocking(dbx.users_get_current_account)
         return jsonify({
             'enabled': True,
             'connected': True,
@@ -314,7 +440,7 @@ def dropbox_status():
             'message': 'Connected successfully'
         })
     except Exception as e:
-        print(f"ERROR in dropbox_status: {e}")
+        logger.exception("Error in dropbox_status: %s", e)
         return jsonify({'enabled': True, 'connected': False, 'message': f'Connection error: {e}'}), 500
 
 @app.route('/api/dropbox/upload', methods=['POST'])
@@ -347,41 +473,121 @@ def manual_upload():
         })
         
     except Exception as e:
-        print(f"ERROR in manual_upload: {e}")
+        logger.exception("Error in manual_upload: %s", e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def apply_standings(changes, changed_drivers):
+    """Überträgt Positionen/Gaps aus der Rangliste in race_data"""
+    for standing in changes:
+        driver_id = standing['driver_id']
+        if driver_id in race_data['drivers']:
+            race_data['drivers'][driver_id].update(
+                position=standing['position'],
+                gap=standing['gap'],
+                interval=standing['interval']
+            )
+            changed_drivers.add(driver_id)
+
+def record_sectors(driver_id, lap_data):
+    """Sektorzeiten einer Runde in die Ideal-Runde übernehmen und bei Änderung pushen"""
+    sectors = range(1, sector_tracker.sectors + 1)
+    with state_lock:
+        changed = sector_tracker.record_lap(
+            driver_id,
+            [lap_data.get(f'sector_{n}') for n in sectors],
+            [lap_data.get(f'sector_{n}_pb') for n in sectors]
+        )
+        update = sector_tracker.driver_update(driver_id) if changed else None
+    if changed:
+        # Zeiten sind bereits Millisekunden, beide Formate bekommen denselben Payload
+        emit_topic('ideal_lap_update', 'ideal_lap', update, update)
+
+def emit_topic(event, topic, payload, compact_payload):
+    """Sendet ein Update an JSON- und Compact-Abonnenten eines Topics"""
+    socketio.emit(event, payload, to=topic)
+    socketio.emit(event, compact_payload, to=wire_format.compact_room(topic))
+
 @app.route('/api/smartrace', methods=['POST'])
 def receive_smartrace_data():
     """Receive data from SmartRace"""
+    if WORKER_ROLE == 'viewer':
+        return jsonify({'error': 'This worker does not accept SmartRace data, send it to the ingest worker'}), 503
+    
+    wait = ingest_guard.check_rate(request.remote_addr)
+    if wait:
+        logger.info("⚠️ Rate limit exceeded for %s", request.remote_addr, extra={'sample': 'rate_limited'})
+        response = jsonify({'error': 'Rate limit exceeded'})
+        response.headers['Retry-After'] = str(max(1, round(wait)))
+        return response, 429
+    
+    event_key = None
     try:
         data = request.get_json()
-        print(f"📥 Received SmartRace data: {json.dumps(data, indent=2)}")
+        
+        # Erneut gesendete Events nur bestätigen, nicht noch einmal verarbeiten
+        key = get_event_key(data)
+        if ingest_guard.is_duplicate(key):
+            logger.info("🔁 Duplicate SmartRace event ignored", extra={'sample': 'smartrace_duplicate'})
+            return jsonify({'success': True, 'duplicate': True})
+        event_key = key
+        if ingest_guard.should_shed(data, ingest_queue.qsize()):
+            ingest_guard.forget(event_key)
+            logger.info("⚠️ Ingest queue backed up, dropping low-priority event", extra={'sample': 'smartrace_shed'})
+            return jsonify({'success': True, 'shed': True})
+        
+        logger.info("📥 Received SmartRace data", extra={'sample': 'smartrace_event', 'keys': list(data or {})})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📥 SmartRace payload: %s", LazyJson(data, indent=2))
+        
+        updated_topics = set()
+        changed_drivers = set()
+        
+        # Persist raw SmartRace events
+        if 'event_data' in data:
+            if not ingest_queue.put(data):
+                ingest_guard.forget(event_key)
+                # Kein 200, sonst verwirft SmartRace die Runde - so sendet es später erneut
+                return jsonify({'error': 'Ingest queue full, retry later'}), 503
+            # Ab hier ist das Event persistiert, ein Retry nach einem Fehler würde es doppelt schreiben
+            event_key = None
+            event_data = data['event_data']
+            event_driver_id = event_data.get('driver_data', {}).get('id')
+            if event_driver_id is not None:
+                record_sectors(str(event_driver_id), event_data)
         
         # Handle driver data
         if 'driver_data' in data:
             driver_data = data['driver_data']
             driver_id = str(driver_data.get('id', 'unknown'))
             
-            race_data['drivers'][driver_id] = {
-                'name': driver_data.get('name', f'Driver {driver_id}'),
-                'car_number': driver_data.get('car_number'),
-                'position': driver_data.get('position'),
-                'best_lap': driver_data.get('best_lap'),
-                'last_lap': driver_data.get('last_lap'),
-                'total_laps': driver_data.get('total_laps'),
-                'total_time': driver_data.get('total_time'),
-                'gap': driver_data.get('gap'),
-                'status': driver_data.get('status', 'Running')
-            }
+            with state_lock:
+                race_data['drivers'][driver_id] = {
+                    'name': driver_data.get('name', f'Driver {driver_id}'),
+                    'car_number': driver_data.get('car_number'),
+                    'position': driver_data.get('position'),
+                    'best_lap': driver_data.get('best_lap'),
+                    'last_lap': driver_data.get('last_lap'),
+                    'total_laps': driver_data.get('total_laps'),
+                    'total_time': driver_data.get('total_time'),
+                    'gap': driver_data.get('gap'),
+                    'interval': None,
+                    'status': driver_data.get('status', 'Running')
+                }
+                
+                changes = leaderboard.update(
+                    driver_id,
+                    laps=driver_data.get('total_laps'),
+                    total_time=driver_data.get('total_time'),
+                    best_lap=driver_data.get('best_lap')
+                )
+                changes.append(leaderboard.standing(driver_id))
+                apply_standings(changes, changed_drivers)
         
         # Handle lap data
         if 'lap_data' in data:
             lap_data = data['lap_data']
             driver_id = str(data.get('driver_data', {}).get('id', 'unknown'))
             
-            if driver_id not in lap_history:
-                lap_history[driver_id] = []
-            
             lap_info = {
                 'lap_number': lap_data.get('lap_number'),
                 'lap_time': lap_data.get('lap_time'),
@@ -391,33 +597,58 @@ def receive_smartrace_data():
                 'timestamp': datetime.datetime.now().isoformat()
             }
             
-            lap_history[driver_id].append(lap_info)
-            
-            if len(lap_history[driver_id]) > 100:
-                lap_history[driver_id] = lap_history[driver_id][-100:]
+            with state_lock:
+                laps = lap_history.setdefault(driver_id, [])
+                laps.append(lap_info)
+                if len(laps) > 100:
+                    lap_history[driver_id] = laps[-100:]
+            record_sectors(driver_id, lap_data)
             
-            socketio.emit('lap_update', {
+            lap_message = {
                 'driver_id': driver_id,
                 'lap_data': lap_info
-            })
+            }
+            compact_lap = wire_format.encode_lap(driver_id, lap_info)
+            emit_topic('lap_update', 'laps', lap_message, compact_lap)
+            emit_topic('lap_update', f'driver:{driver_id}', lap_message, compact_lap)
+            http_cache.invalidate('lap-history')
         
         # Handle session data
         if 'session_data' in data:
             session_data = data['session_data']
-            race_data['session_info'].update({
-                'session_type': session_data.get('type', race_data['session_info']['session_type']),
-                'total_time': session_data.get('total_time', race_data['session_info']['total_time']),
-                'current_lap': session_data.get('current_lap', race_data['session_info']['current_lap']),
-                'session_status': session_data.get('status', race_data['session_info']['session_status']),
-                'flag_status': session_data.get('flag_status', race_data['session_info']['flag_status'])
-            })
+            updated_topics.add('session')
+            with state_lock:
+                if 'type' in session_data:
+                    apply_standings(leaderboard.set_mode(session_mode(session_data['type'])), changed_drivers)
+                race_data['session_info'].update({
+                    'session_type': session_data.get('type', race_data['session_info']['session_type']),
+                    'total_time': session_data.get('total_time', race_data['session_info']['total_time']),
+                    'current_lap': session_data.get('current_lap', race_data['session_info']['current_lap']),
+                    'session_status': session_data.get('status', race_data['session_info']['session_status']),
+                    'flag_status': session_data.get('flag_status', race_data['session_info']['flag_status'])
+                })
+        
+        # Kopien unter dem Lock, serialisiert wird danach ohne
+        with state_lock:
+            changed = {driver_id: dict(race_data['drivers'][driver_id]) for driver_id in changed_drivers}
+            session_info = dict(race_data['session_info'])
+            snapshot = {'session_info': session_info,
+                        'drivers': {driver_id: dict(driver) for driver_id, driver in race_data['drivers'].items()}}
         
-        socketio.emit('race_update', race_data)
+        if changed:
+            # Nur geänderte Fahrer verschicken, Clients mergen in ihre Tabelle
+            emit_topic('leaderboard_changes', 'leaderboard', changed, wire_format.encode_drivers(changed))
+        if 'session' in updated_topics:
+            emit_topic('session_update', 'session', session_info, wire_format.encode_session(session_info))
+        socketio.emit('race_update', snapshot, to='race')
+        if changed_drivers or 'session' in updated_topics:
+            http_cache.invalidate('race-data')
         
         return jsonify({'success': True, 'message': 'Data processed successfully'})
         
     except Exception as e:
-        print(f"Error processing SmartRace data: {e}")
+        ingest_guard.forget(event_key)
+        logger.exception("Error processing SmartRace data: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/export/csv/race-results')
@@ -432,7 +663,7 @@ def export_race_results():
         
         return response
     except Exception as e:
-        print(f"ERROR in export_race_results: {e}")
+        logger.exception("Error in export_race_results: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/export/csv/lap-history')
@@ -447,20 +678,118 @@ def export_lap_history():
         
         return response
     except Exception as e:
-        print(f"ERROR in export_lap_history: {e}")
+        logger.exception("Error in export_lap_history: %s", e)
         return jsonify({'error': str(e)}), 500
 
+# Viewer-Worker spiegeln den Zustand des Ingest-Workers aus dem Message Bus
+def mirror_bus_event(event, data, room, local):
+    """Übernimmt Updates anderer Worker in den lokalen Zustand"""
+    # Nur Broadcasts an Topic-Räume - Snapshots an einzelne Clients (sid) und #compact nicht
+    if local or room not in TOPICS:
+        return
+    
+    if event == 'race_update' and room == 'race':
+        race_data['session_info'] = data['session_info']
+        race_data['drivers'] = data['drivers']
+        http_cache.invalidate('race-data')
+    elif event == 'leaderboard_update' and room == 'leaderboard':
+        race_data['drivers'] = data
+        http_cache.invalidate('race-data')
+    elif event == 'leaderboard_changes' and room == 'leaderboard':
+        race_data['drivers'].update(data)
+        http_cache.invalidate('race-data')
+    elif event == 'ideal_lap_update' and room == 'ideal_lap':
+        sector_tracker.merge_update(data)
+    elif event == 'session_update' and room == 'session':
+        race_data['session_info'] = data
+        http_cache.invalidate('race-data')
+    elif event == 'lap_update' and room == 'laps':
+        laps = lap_history.setdefault(data['driver_id'], [])
+        laps.append(data['lap_data'])
+        if len(laps) > 100:
+            lap_history[data['driver_id']] = laps[-100:]
+        http_cache.invalidate('lap-history')
+
+if SOCKETIO_MESSAGE_QUEUE:
+    # Nur Viewer spiegeln - der Ingest-Worker hält den maßgeblichen Zustand
+    if WORKER_ROLE == 'viewer':
+        client_manager.add_listener(mirror_bus_event)
+    # Bus ab Start lesen, python-socketio würde den Listener erst beim ersten Connect starten
+    socketio.server.manager_initialized = True
+    client_manager.initialize()
+
 # SocketIO Events
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
-    print("🔌 Client connected")
-    emit('race_update', race_data)
+    logger.info("🔌 Client connected", extra={'sample': 'socket_connect'})
+
+def send_topic_snapshot(topic, compact=False):
+    """Schickt dem neuen Abonnenten den aktuellen Stand eines Topics"""
+    if topic == 'race':
+        emit('race_update', race_data)
+    elif topic == 'leaderboard':
+        drivers = race_data['drivers']
+        emit('leaderboard_update', wire_format.encode_drivers(drivers) if compact else drivers)
+    elif topic == 'session':
+        session_info = race_data['session_info']
+        emit('session_update', wire_format.encode_session(session_info) if compact else session_info)
+    elif topic == 'ideal_lap':
+        emit('ideal_lap_update', sector_tracker.snapshot())
+    elif topic.startswith('driver:'):
+        driver_id = topic[len('driver:'):]
+        for lap_info in lap_history.get(driver_id, [])[-20:]:
+            if compact:
+                emit('lap_update', wire_format.encode_lap(driver_id, lap_info))
+            else:
+                emit('lap_update', {'driver_id': driver_id, 'lap_data': lap_info})
+
+def valid_topics(data):
+    """Filtert die angefragten Topics auf bekannte Namen"""
+    topics = (data or {}).get('topics', [])
+    if not isinstance(topics, list):
+        return []
+    return [t for t in topics if isinstance(t, str) and (t in TOPICS or t.startswith('driver:'))]
+
+def is_compact(data):
+    """Client hat das kompakte Format angefragt ({'format': 'compact'})"""
+    return isinstance(data, dict) and data.get('format') == 'compact'
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Client abonniert Topics, z.B. {'topics': ['leaderboard', 'session', 'laps'], 'format': 'compact'}"""
+    topics = valid_topics(data)
+    compact = is_compact(data)
+    if compact:
+        # Schema vor den ersten Snapshots, damit der Client dekodieren kann
+        emit('schema', wire_format.schema_message())
+    for topic in topics:
+        # race bleibt immer JSON (Kompatibilität mit externen Overlays)
+        join_room(wire_format.compact_room(topic) if compact and topic != 'race' else topic)
+        send_topic_snapshot(topic, compact)
+    return {'subscribed': topics, 'format': 'compact' if compact else 'json'}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Client verlässt Topics"""
+    topics = valid_topics(data)
+    compact = is_compact(data)
+    for topic in topics:
+        leave_room(wire_format.compact_room(topic) if compact and topic != 'race' else topic)
+    return {'unsubscribed': topics}
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    print("🔌 Client disconnected")
+    logger.info("🔌 Client disconnected", extra={'sample': 'socket_disconnect'})
+
+def precompile_templates():
+    """Kompiliert alle Templates vorab in den Bytecode-Cache"""
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            logger.warning("⚠️ Template %s failed to compile: %s", name, e)
 
 # Auto-backup thread
 def start_auto_backup():
@@ -474,28 +803,42 @@ def start_auto_backup():
         while True:
             time.sleep(interval)
             if race_data['session_info']['session_status'] in ['Running', 'Finished']:
-                auto_backup_session()
+                upload_queue.put(auto_backup_session)
     
     backup_thread = threading.Thread(target=backup_loop, daemon=True)
     backup_thread.start()
-    print(f"✅ Auto-backup started (interval: {interval}s)")
+    logger.info("✅ Auto-backup started (interval: %ss)", interval)
 
 # Main
 if __name__ == '__main__':
-    print("🏁 SmartRace Dashboard with Dropbox Integration")
-    print(f"📁 Dropbox: {'✅ Enabled' if DROPBOX_ENABLED else '❌ Disabled'}")
+    logger.info("🏁 SmartRace Dashboard with Dropbox Integration")
+    logger.info("📁 Dropbox: %s", '✅ Enabled' if DROPBOX_ENABLED else '❌ Disabled')
     if DROPBOX_ENABLED:
-        print(f"📂 Dropbox folder: {DROPBOX_FOLDER}")
-        # Start auto-backup thread
-        start_auto_backup()
+        logger.info("📂 Dropbox folder: %s", DROPBOX_FOLDER)
+        if DROPBOX_ACCESS_TOKEN:
+            # Verbindet erst, wenn der Server läuft (startet danach das Auto-Backup)
+            socketio.start_background_task(start_dropbox)
+    
+    # Templates vorkompilieren, ohne den Start zu verzögern
+    socketio.start_background_task(precompile_templates)
+    
+    async_server.install_signal_handlers()
+    logger.info("🚀 Server mode: %s, worker role: %s, port: %s", ASYNC_MODE, WORKER_ROLE, PORT)
     
     # Production-ready server start
     try:
         socketio.run(app, 
                     host='0.0.0.0', 
-                    port=5000, 
+                    port=PORT, 
                     debug=False,  # Debug auf False für Production
                     use_reloader=False,  # Verhindert doppelte Starts
-                    allow_unsafe_werkzeug=True)  # Für Development erlauben
+                    **async_server.run_kwargs())
     except Exception as e:
-        print(f"❌ Server start failed: {e}")
+        logger.exception("❌ Server start failed: %s", e)
+    finally:
+        # Graceful Shutdown: offene Rundendaten speichern, letztes Backup hochladen
+        if DROPBOX_ENABLED and dbx and os.getenv('AUTO_UPLOAD_ON_SESSION_END', 'true').lower() == 'true':
+            upload_queue.put(auto_backup_session)
+        ingest_queue.drain()
+        upload_queue.drain()
+        logger.info("👋 Server stopped")
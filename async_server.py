@@ -0,0 +1,181 @@
+import os
+import queue
+import signal
+import threading
+import logging
+
+# threading = Werkzeug Dev-Server, eventlet/gevent = Green-Thread Server für Produktion
+ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading').lower()
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 10))
+
+logger = logging.getLogger('smartrace.server')
+
+_STOP = object()
+
+
+def monkey_patch():
+    """Patcht die Standardbibliothek für Green Threads - muss vor allen anderen Imports laufen"""
+    if ASYNC_MODE == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif ASYNC_MODE == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    elif ASYNC_MODE != 'threading':
+        raise ValueError(f"Unknown ASYNC_MODE: {ASYNC_MODE}")
+
+
+def run_blocking(func, *args, **kwargs):
+    """Führt blockierende Aufrufe (z.B. SQLite) in einem echten OS-Thread aus"""
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+class NativeQueue:
+    """Begrenzte Queue auf Basis der C-SimpleQueue (echte Locks, auch unter gevent)"""
+
+    def __init__(self, maxsize=0):
+        from gevent import monkey
+        self.maxsize = maxsize
+        self._queue = monkey.get_original('queue', 'SimpleQueue')()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def put(self, item, block=True, timeout=None):
+        if self.maxsize and self._queue.qsize() >= self.maxsize:
+            raise queue.Full
+        self._queue.put(item)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        return self._queue.get(block, timeout)
+
+
+class NativeThread:
+    """Echter OS-Thread unter gevent (threading.Thread würde zum Greenlet)"""
+
+    def __init__(self, target, name=None, daemon=True):
+        from gevent import monkey
+        self.target = target
+        self.name = name
+        self.daemon = daemon
+        self._start_new_thread, allocate_lock = monkey.get_original('_thread', ['start_new_thread', 'allocate_lock'])
+        self._done = allocate_lock()
+        self._done.acquire()
+
+    def start(self):
+        self._start_new_thread(self._run, ())
+
+    def _run(self):
+        try:
+            self.target()
+        finally:
+            self._done.release()
+
+    def join(self, timeout=None):
+        if self._done.acquire(timeout=-1 if timeout is None else timeout):
+            self._done.release()
+
+    def is_alive(self):
+        return self._done.locked()
+
+
+def native_primitives():
+    """Queue und Thread ohne Green-Thread Patching, für Arbeit die auch aus echten OS-Threads kommt"""
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import patcher
+        return patcher.original('queue').Queue, patcher.original('threading').Thread
+    if ASYNC_MODE == 'gevent':
+        return NativeQueue, NativeThread
+    return queue.Queue, threading.Thread
+
+
+def run_kwargs():
+    """Zusätzliche Parameter für socketio.run() je nach Server-Modus"""
+    if ASYNC_MODE == 'threading':
+        return {'allow_unsafe_werkzeug': True}
+    return {}
+
+
+class BackgroundQueue:
+    """Arbeitet Jobs in einem Worker ab, damit Requests nicht auf I/O warten"""
+
+    def __init__(self, name, handler, maxsize=1000, offload=True):
+        self.name = name
+        self.handler = handler
+        self.offload = offload
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.closed = False
+        self._worker = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name=f'{self.name}-worker', daemon=True)
+            self._worker.start()
+        return self
+
+    def put(self, item):
+        """Reiht einen Job ein, gibt False zurück wenn die Queue voll oder geschlossen ist"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            logger.warning("⚠️ %s queue full, dropping job", self.name)
+            return False
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if self.offload:
+                    run_blocking(self.handler, item)
+                else:
+                    self.handler(item)
+            except Exception as e:
+                logger.exception("❌ %s job failed: %s", self.name, e)
+            finally:
+                self.queue.task_done()
+
+    def drain(self, timeout=SHUTDOWN_TIMEOUT):
+        """Nimmt keine neuen Jobs mehr an und wartet bis alle offenen abgearbeitet sind"""
+        self.closed = True
+        if self._worker is None:
+            return True
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            logger.warning("⚠️ %s queue not drained, %d jobs left", self.name, self.qsize())
+            return False
+        return True
+
+
+def install_signal_handlers():
+    """SIGTERM (docker stop) beendet den Server-Loop wie Ctrl+C"""
+    if ASYNC_MODE == 'gevent':
+        # Der Hub läuft in C, ein Python-Signalhandler käme dort nie an
+        import gevent
+        gevent.signal_handler(signal.SIGTERM, gevent.kill, gevent.getcurrent(), SystemExit(0))
+        return
+
+    def handle_sigterm(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
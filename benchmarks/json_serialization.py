@@ -0,0 +1,93 @@
+"""Vergleicht stdlib json mit dem serializer-Backend (orjson) auf typischen Renn-Payloads
+
+    python benchmarks/json_serialization.py --drivers 20 --laps 100
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serializer  # noqa: E402
+
+
+def lap_time(rng):
+    return f'1:0{rng.randint(0, 9)}.{rng.randint(0, 999):03d}'
+
+
+def build_payloads(drivers, laps, seed=1):
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    race_data = {
+        'session_info': {
+            'session_type': 'Race', 'total_time': '00:12:34', 'total_laps': laps, 'current_lap': laps,
+            'session_status': 'Running', 'flag_status': 'Green', 'session_start': now.isoformat(),
+            'session_name': 'SmartRace_Session_Benchmark'
+        },
+        'drivers': {
+            str(i): {
+                'name': f'Fahrer {i} – Müller', 'car_number': i + 1, 'position': i + 1,
+                'best_lap': lap_time(rng), 'last_lap': lap_time(rng), 'total_laps': laps,
+                'total_time': '00:12:34.567', 'gap': f'+{i * 1.234:.3f}', 'interval': '+1.234',
+                'status': 'Running'
+            } for i in range(drivers)
+        }
+    }
+    lap_history = {
+        str(i): [{
+            'lap_number': lap + 1, 'lap_time': lap_time(rng),
+            'sector_1': rng.uniform(18, 22), 'sector_2': rng.uniform(20, 25), 'sector_3': rng.uniform(19, 23),
+            'timestamp': (now + datetime.timedelta(seconds=lap * 62)).isoformat()
+        } for lap in range(laps)] for i in range(drivers)
+    }
+    event = {
+        'event_type': 'ui.lap_update',
+        'event_data': {
+            'lap': 12, 'laptime': '1:02.345', 'laptime_raw': 62345,
+            'sector_1': '0:20.123', 'sector_1_pb': True, 'sector_2': '0:21.456', 'sector_2_pb': False,
+            'sector_3': '0:20.766', 'sector_3_pb': False, 'lap_pb': False,
+            'driver_data': {'id': 7, 'name': 'Fahrer 7'},
+            'car_data': {'id': 3, 'name': 'Porsche 911 GT3', 'manufacturer': 'Carrera'}
+        }
+    }
+    backup = {'race_data': race_data, 'lap_history': lap_history, 'export_timestamp': now.isoformat()}
+    return {
+        'race_update (socket)': (race_data, {'separators': (',', ':')}),
+        'lap_history (API)': (lap_history, {'sort_keys': True}),
+        'raw_data (DB insert)': (event, {}),
+        'session backup (indent=2)': (backup, {'indent': 2})
+    }
+
+
+def bench(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--drivers', type=int, default=20)
+    parser.add_argument('--laps', type=int, default=100)
+    parser.add_argument('--number', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'backend={serializer.BACKEND} drivers={args.drivers} laps={args.laps}')
+    print(f'{"payload":<28}{"bytes":>10}{"json µs":>12}{serializer.BACKEND + " µs":>14}{"speedup":>10}')
+    for name, (payload, kwargs) in build_payloads(args.drivers, args.laps).items():
+        size = len(json.dumps(payload, **kwargs).encode('utf-8'))
+        stdlib = bench(lambda: json.dumps(payload, **kwargs), args.number, args.repeat)
+        fast = bench(lambda: serializer.dumps(payload, **kwargs), args.number, args.repeat)
+        print(f'{name:<28}{size:>10}{stdlib * 1e6:>12.1f}{fast * 1e6:>14.1f}{stdlib / fast:>9.1f}x')
+
+    encoded = json.dumps(build_payloads(args.drivers, args.laps)['lap_history (API)'][0])
+    stdlib = bench(lambda: json.loads(encoded), args.number, args.repeat)
+    fast = bench(lambda: serializer.loads(encoded), args.number, args.repeat)
+    print(f'{"lap_history loads":<28}{len(encoded):>10}{stdlib * 1e6:>12.1f}{fast * 1e6:>14.1f}{stdlib / fast:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
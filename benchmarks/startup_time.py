@@ -0,0 +1,76 @@
+"""Misst, wie lange app.py braucht, bis Port 5000 (bzw. --port) Verbindungen annimmt
+
+Dropbox ist aktiviert, aber das Netzwerk zeigt auf eine nicht erreichbare Adresse -
+der Serverstart darf davon nicht abhängen.
+
+    python benchmarks/startup_time.py --target 2.0
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(port, deadline):
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.05):
+                return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+
+def measure(port, mode, timeout):
+    data_dir = tempfile.mkdtemp(prefix='smartrace-bench-')
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        ASYNC_MODE=mode,
+        DATABASE_PATH=os.path.join(data_dir, 'smartrace.db'),
+        DROPBOX_ENABLED='true',
+        DROPBOX_ACCESS_TOKEN='benchmark-invalid-token',
+        # Kein Netzwerk: alle HTTPS-Requests laufen gegen einen nicht routbaren Proxy
+        HTTPS_PROXY='http://10.255.255.1:9',
+        LOG_LEVEL='WARNING'
+    )
+    start = time.monotonic()
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = wait_for_port(port, start + timeout)
+        return time.monotonic() - start if ready else None
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--mode', default=os.getenv('ASYNC_MODE', 'threading'))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--target', type=float, default=2.0, help='Zielzeit in Sekunden')
+    args = parser.parse_args()
+
+    results = []
+    for run in range(args.runs):
+        elapsed = measure(args.port, args.mode, timeout=max(args.target * 5, 10))
+        if elapsed is None:
+            print(f"run {run + 1}: port {args.port} not accepting connections")
+            return 1
+        results.append(elapsed)
+        print(f"run {run + 1}: {elapsed:.3f}s")
+
+    best, worst = min(results), max(results)
+    print(f"mode={args.mode} best={best:.3f}s worst={worst:.3f}s target={args.target:.3f}s")
+    return 0 if worst <= args.target else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
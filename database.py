@@ -1,23 +1,56 @@
 import sqlite3
-import json
+import serializer
 import os
-from datetime import datetime
-import statistics
+import time
+import threading
+from urllib.parse import quote
+from datetime import datetime, timedelta
+
+# Wird in PRAGMA user_version gespeichert, bei Schema-Änderungen hochzählen
+SCHEMA_VERSION = 1
+
+# Spalten von lap_updates, raw_data wird beim Blättern nur auf Anfrage geladen
+LAP_COLUMNS = (
+    'id', 'timestamp', 'datetime', 'controller_id', 'lap', 'laptime', 'laptime_raw',
+    'sector_1', 'sector_1_pb', 'sector_2', 'sector_2_pb', 'sector_3', 'sector_3_pb',
+    'lap_pb', 'driver_id', 'driver_name', 'car_id', 'car_name', 'car_manufacturer', 'raw_data'
+)
+DEFAULT_LAP_COLUMNS = tuple(c for c in LAP_COLUMNS if c != 'raw_data')
 
 class RaceDatabase:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, snapshot_path=None, snapshot_max_age=None):
         if db_path is None:
             db_path = os.environ.get('DATABASE_PATH', '/app/data/smartrace.db')
         
+        # Analyse-Abfragen laufen optional auf einer Kopie, damit sie das Schreiben nicht bremsen
+        # ANALYSIS_SNAPSHOT: leer = aus, ':memory:' = im RAM, sonst Dateipfad
+        if snapshot_path is None:
+            snapshot_path = os.environ.get('ANALYSIS_SNAPSHOT', '')
+        if snapshot_max_age is None:
+            snapshot_max_age = float(os.environ.get('ANALYSIS_SNAPSHOT_MAX_AGE', 30))
+        
         self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self.snapshot_max_age = snapshot_max_age
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_uri = None
+        self._snapshot_anchor = None
+        self._snapshot_time = 0
+        self._snapshot_generation = 0
+        
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         self.init_database()
     
     def init_database(self):
-        """Erstelle die Datenbanktabellen falls sie nicht existieren"""
+        """Erstelle die Datenbanktabellen falls sie nicht existieren (einmal pro Schema-Version)"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        cursor.execute('PRAGMA user_version')
+        if cursor.fetchone()[0] >= SCHEMA_VERSION:
+            conn.close()
+            return
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS lap_updates (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,9 +76,58 @@ class RaceDatabase:
             )
         ''')
         
+        # WAL: Leser (Analyse, Snapshot-Backup) blockieren den Schreiber nicht
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        # Indizes für Keyset-Pagination (timestamp, id) und Fahrer-Filter
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lap_updates_timestamp ON lap_updates (timestamp, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lap_updates_driver ON lap_updates (driver_id, timestamp, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lap_updates_car ON lap_updates (car_id, timestamp, id)')
+        
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
         conn.close()
     
+    def _connect_analysis(self):
+        """Verbindung für Analyse-Abfragen, bei aktivem Snapshot auf die höchstens snapshot_max_age alte Kopie"""
+        if not self.snapshot_path:
+            return sqlite3.connect(self.db_path)
+        
+        with self._snapshot_lock:
+            if self._snapshot_uri is None or time.monotonic() - self._snapshot_time > self.snapshot_max_age:
+                self.refresh_snapshot()
+            uri = self._snapshot_uri
+        return sqlite3.connect(uri, uri=True)
+    
+    def refresh_snapshot(self):
+        """Kopiert die Datenbank per SQLite Online-Backup in den Snapshot"""
+        source = sqlite3.connect(self.db_path)
+        self._snapshot_generation += 1
+        
+        if self.snapshot_path == ':memory:':
+            # Neue Shared-Cache-DB pro Generation, laufende Abfragen lesen die alte zu Ende
+            uri = f'file:smartrace_snapshot_{id(self)}_{self._snapshot_generation}?mode=memory&cache=shared'
+            target = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            source.backup(target)
+            previous = self._snapshot_anchor
+            # Die In-Memory-DB lebt nur solange eine Verbindung offen ist
+            self._snapshot_anchor = target
+            if previous is not None:
+                previous.close()
+        else:
+            temp_path = f'{self.snapshot_path}.tmp'
+            target = sqlite3.connect(temp_path)
+            source.backup(target)
+            target.execute('PRAGMA journal_mode=DELETE')
+            target.close()
+            # Atomar ersetzen, offene Leser behalten die alte Datei
+            os.replace(temp_path, self.snapshot_path)
+            uri = f'file:{quote(os.path.abspath(self.snapshot_path))}?mode=ro'
+        
+        source.close()
+        self._snapshot_uri = uri
+        self._snapshot_time = time.monotonic()
+    
     def insert_lap_update(self, data):
         """Speichere Rundendaten in der Datenbank"""
         conn = sqlite3.connect(self.db_path)
@@ -80,7 +162,7 @@ class RaceDatabase:
             car_data.get('id'),
             car_data.get('name'),
             car_data.get('manufacturer'),
-            json.dumps(data)
+            serializer.dumps(data)
         ))
         
         conn.commit()
@@ -88,7 +170,7 @@ class RaceDatabase:
     
     # Bestehende Funktionen...
     def get_driver_stats(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect_analysis()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -133,6 +215,92 @@ class RaceDatabase:
         conn.close()
         return results
     
+    def browse_laps(self, limit=50, before=None, since=None, driver_id=None, car_id=None,
+                    session=None, pb_only=False, start=None, end=None, columns=None):
+        """Blättern durch lap_updates mit Keyset-Pagination auf (timestamp, id)
+
+        before: Cursor für ältere Runden (neueste zuerst), since: Cursor für neue Runden
+        seit dem letzten Abruf (älteste zuerst). Cursor haben das Format 'timestamp:id'.
+        session ist ein Datum (YYYY-MM-DD) wie in get_session_comparison.
+        """
+        limit = max(1, int(limit))
+        columns = tuple(columns) if columns else DEFAULT_LAP_COLUMNS
+        unknown = set(columns) - set(LAP_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        # timestamp/id werden für den Cursor immer gebraucht
+        selected = tuple(dict.fromkeys(('timestamp', 'id') + columns))
+        
+        conditions = []
+        params = []
+        if driver_id is not None:
+            conditions.append('driver_id = ?')
+            params.append(driver_id)
+        if car_id is not None:
+            conditions.append('car_id = ?')
+            params.append(car_id)
+        if session:
+            day = datetime.strptime(session, '%Y-%m-%d')
+            conditions.append('datetime >= ? AND datetime < ?')
+            params += [day.strftime('%Y-%m-%d'), (day + timedelta(days=1)).strftime('%Y-%m-%d')]
+        if pb_only:
+            conditions.append('lap_pb = 1')
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(int(start))
+        if end is not None:
+            conditions.append('timestamp <= ?')
+            params.append(int(end))
+        
+        if since:
+            timestamp, row_id = self._parse_cursor(since)
+            # Row-Value-Vergleich, damit SQLite direkt im Index (timestamp, id) einsteigt
+            conditions.append('(timestamp, id) > (?, ?)')
+            params += [timestamp, row_id]
+            order = 'ASC'
+        else:
+            if before:
+                timestamp, row_id = self._parse_cursor(before)
+                conditions.append('(timestamp, id) < (?, ?)')
+                params += [timestamp, row_id]
+            order = 'DESC'
+        
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Eine Zeile mehr laden, um zu wissen ob es weitergeht
+        cursor.execute(f'''
+            SELECT {', '.join(selected)} FROM lap_updates
+            {where_clause}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT ?
+        ''', params + [limit + 1])
+        rows = cursor.fetchall()
+        conn.close()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        laps = []
+        for row in rows:
+            values = dict(zip(selected, row))
+            laps.append({column: values[column] for column in columns})
+        next_cursor = f'{rows[-1][0]}:{rows[-1][1]}' if rows else (since or before)
+        
+        return {
+            'laps': laps,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+    
+    @staticmethod
+    def _parse_cursor(cursor):
+        timestamp, _, row_id = str(cursor).partition(':')
+        try:
+            return int(timestamp), int(row_id)
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+    
     def get_database_info(self):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -159,7 +327,7 @@ class RaceDatabase:
     # Neue Analyse-Funktionen
     def get_analysis_overview(self):
         """Umfassende Übersicht für die Analyse"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect_analysis()
         cursor = conn.cursor()
         
         # Gesamtstatistiken
@@ -235,108 +403,56 @@ class RaceDatabase:
     
     def get_driver_analysis(self, driver_id=None):
         """Detailanalyse für alle Fahrer oder einen spezifischen Fahrer"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        where_clause = ""
-        params = ()
-        if driver_id:
-            where_clause = "WHERE driver_id = ?"
-            params = (driver_id,)
-        
-        cursor.execute(f'''
-            SELECT 
-                driver_name,
-                driver_id,
-                COUNT(*) as total_laps,
-                MIN(laptime_raw) as best_time,
-                MAX(laptime_raw) as worst_time,
-                AVG(laptime_raw) as avg_time,
-                COUNT(CASE WHEN lap_pb = 1 THEN 1 END) as personal_bests
-            FROM lap_updates 
-            {where_clause}
-            AND laptime_raw IS NOT NULL AND laptime_raw > 0
-            GROUP BY driver_name, driver_id
-            ORDER BY best_time ASC
-        ''', params)
+        stats = self.get_lap_statistics(driver_id)
         
         results = []
-        for row in cursor.fetchall():
-            # Berechne Konsistenz (Standardabweichung)
-            cursor.execute('''
-                SELECT laptime_raw FROM lap_updates 
-                WHERE driver_id = ? AND laptime_raw IS NOT NULL AND laptime_raw > 0
-            ''', (row[1],))
-            lap_times = [r[0] for r in cursor.fetchall()]
-            
-            consistency = 0
-            if len(lap_times) > 1:
-                consistency = statistics.stdev(lap_times)
-            
+        for row in sorted(stats, key=lambda x: x['best_time']):
             results.append({
-                'driver_name': row[0],
-                'driver_id': row[1],
-                'total_laps': row[2],
-                'best_time': row[3],
-                'worst_time': row[4],
-                'avg_time': row[5],
-                'personal_bests': row[6],
-                'consistency': consistency,
-                'improvement': row[4] - row[3] if row[3] and row[4] else 0
+                'driver_name': row['driver_name'],
+                'driver_id': row['driver_id'],
+                'total_laps': row['total_laps'],
+                'best_time': row['best_time'],
+                'worst_time': row['worst_time'],
+                'avg_time': row['avg_time'],
+                'personal_bests': row['personal_bests'],
+                # Konsistenz ohne Outlaps, Boxenstopps und Abflüge
+                'consistency': row['stdev'],
+                'improvement': row['worst_time'] - row['best_time']
             })
         
-        conn.close()
         return results
     
     def get_consistency_analysis(self):
         """Analyse der Fahrkonsistenz"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT DISTINCT driver_name, driver_id 
-            FROM lap_updates 
-            WHERE laptime_raw IS NOT NULL AND laptime_raw > 0
-        ''')
-        drivers = cursor.fetchall()
+        stats = self.get_lap_statistics()
         
         results = []
-        for driver_name, driver_id in drivers:
-            cursor.execute('''
-                SELECT laptime_raw 
-                FROM lap_updates 
-                WHERE driver_id = ? AND laptime_raw IS NOT NULL AND laptime_raw > 0
-                ORDER BY timestamp
-            ''', (driver_id,))
-            
-            lap_times = [row[0] for row in cursor.fetchall()]
-            
-            if len(lap_times) >= 3:
-                avg_time = statistics.mean(lap_times)
-                consistency = statistics.stdev(lap_times)
-                consistency_percent = (consistency / avg_time) * 100
-                
-                # Berechne Verbesserungstrend (erste vs. letzte 5 Runden)
-                first_5 = lap_times[:5]
-                last_5 = lap_times[-5:]
-                trend = statistics.mean(first_5) - statistics.mean(last_5) if len(first_5) >= 3 and len(last_5) >= 3 else 0
-                
+        for row in stats:
+            if row['total_laps'] >= 3:
                 results.append({
-                    'driver_name': driver_name,
-                    'driver_id': driver_id,
-                    'avg_time': avg_time,
-                    'consistency_ms': consistency,
-                    'consistency_percent': consistency_percent,
-                    'trend': trend,
-                    'total_laps': len(lap_times)
+                    'driver_name': row['driver_name'],
+                    'driver_id': row['driver_id'],
+                    'avg_time': row['clean_avg_time'],
+                    'consistency_ms': row['stdev'],
+                    'consistency_percent': (row['stdev'] / row['clean_avg_time']) * 100,
+                    'trend': row['trend'],
+                    'total_laps': row['total_laps']
                 })
         
-        conn.close()
         return sorted(results, key=lambda x: x['consistency_percent'])
     
+    def get_lap_statistics(self, driver_id=None):
+        """Erweiterte Kennzahlen pro Fahrer (Perzentile, gleitender Schnitt, Ausreißer, Trend)"""
+        import analytics  # numpy erst bei der ersten Analyse laden
+        
+        conn = self._connect_analysis()
+        stats = analytics.lap_statistics(analytics.load_lap_matrix(conn, driver_id))
+        conn.close()
+        return stats
+    
     def get_sector_performance(self):
         """Analyse der Sektorzeiten"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect_analysis()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -389,7 +505,7 @@ class RaceDatabase:
     
     def get_car_performance_analysis(self):
         """Analyse der Fahrzeugleistung"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect_analysis()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -423,7 +539,7 @@ class RaceDatabase:
     
     def get_lap_progression(self, driver_id):
         """Rundenfortschritt für einen Fahrer"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect_analysis()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -451,7 +567,7 @@ class RaceDatabase:
 
     def get_session_comparison(self):
         """Vergleiche verschiedene Sessions"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect_analysis()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -0,0 +1,179 @@
+import os
+import gzip
+import hashlib
+import threading
+import collections
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Kleine Antworten lohnen die Kompression nicht (Header + CPU > Ersparnis)
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 512))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/', 'image/svg+xml')
+
+# Fingerprinted Assets (?v=<hash>) ändern nie ihren Inhalt
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def negotiate_encoding(accept_encoding):
+    """Wählt br oder gzip anhand von Accept-Encoding, None = unkomprimiert"""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    for encoding in (('br',) if brotli else ()) + ('gzip',):
+        if offered.get(encoding, offered.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+class SnapshotCache:
+    """Serialisiertes JSON pro Zustandsversion, wird erst nach invalidate() neu gebaut"""
+
+    def __init__(self):
+        self._versions = collections.defaultdict(int)
+        self._entries = {}
+
+    def invalidate(self, *names):
+        for name in names:
+            self._versions[name] += 1
+
+    def get(self, name, build):
+        """Liefert (body, etag), build() läuft nur wenn sich der Zustand geändert hat"""
+        version = self._versions[name]
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != version:
+            body = build()
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            # Version vor dem Bauen merken, ein invalidate() währenddessen erzwingt den nächsten Build
+            entry = self._entries[name] = (version, body, hashlib.md5(body).hexdigest())
+        return entry[1], entry[2]
+
+
+class CompressionCache:
+    """Komprimierte Varianten pro ETag, damit Snapshots und Assets nur einmal gepackt werden"""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag, encoding, data):
+        key = (etag, encoding)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        compressed = compress(data, encoding)
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return compressed
+
+
+class StaticAssets:
+    """Content-Hashes für Dateien unter static/, neu berechnet wenn sich die mtime ändert"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._hashes = {}
+
+    def fingerprint(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._hashes.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = self._hashes[filename] = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+        return cached[1]
+
+
+class HttpCache:
+    """Kompression, JSON-Snapshots mit ETag und immutable Caching für Fingerprinted Assets"""
+
+    def __init__(self, app=None):
+        self.snapshots = SnapshotCache()
+        self.compressed = CompressionCache()
+        self.assets = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.assets = StaticAssets(app.static_folder)
+        app.url_defaults(self._add_fingerprint)
+        app.after_request(self._after_request)
+
+    def invalidate(self, *names):
+        self.snapshots.invalidate(*names)
+
+    def json_snapshot(self, name, build):
+        """Antwort aus dem Snapshot, 304 wenn der Client den Stand schon hat"""
+        body, etag = self.snapshots.get(name, build)
+        response = self.app.response_class(body, mimetype=self.app.json.mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    def _add_fingerprint(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = self.assets.fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    def _after_request(self, response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            version = request.args.get('v')
+            if version and version == self.assets.fingerprint(request.view_args.get('filename', '')):
+                response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return self._compress(response)
+
+    def _compress(self, response):
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        if not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None or (response.is_streamed and not response.direct_passthrough):
+            return response
+
+        # send_file liefert einen File-Wrapper, bei den kleinen Assets lesen wir ihn einfach ein
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+
+        etag, weak = response.get_etag()
+        if etag:
+            compressed = self.compressed.get(etag, encoding, data)
+            # Wie nginx: komprimierte Varianten bekommen ein schwaches ETag
+            response.set_etag(etag, weak=True)
+        else:
+            compressed = compress(data, encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
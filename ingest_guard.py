@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+import collections
+
+# Bei Verbindungsabbrüchen schickt SmartRace Events erneut - gleiche Events innerhalb des Fensters verwerfen
+DEDUP_WINDOW = float(os.getenv('INGEST_DEDUP_WINDOW', 300))
+DEDUP_SIZE = int(os.getenv('INGEST_DEDUP_SIZE', 10000))
+# Token Bucket pro Absender-IP: Dauerrate pro Sekunde und erlaubter Burst
+RATE_LIMIT = float(os.getenv('INGEST_RATE_LIMIT', 50))
+RATE_BURST = float(os.getenv('INGEST_RATE_BURST', 100))
+# Ab dieser Länge der Ingest-Queue werden unwichtige Events verworfen
+SHED_THRESHOLD = int(os.getenv('INGEST_SHED_THRESHOLD', 500))
+LOW_PRIORITY_EVENTS = frozenset(filter(None, (
+    name.strip() for name in os.getenv('INGEST_LOW_PRIORITY_EVENTS', '').split(',')
+)))
+
+
+def event_key(data):
+    """Identität eines SmartRace Events, gleiche Keys gelten als Duplikat
+
+    Nur Runden-Events haben eine echte Identität. Reine Zustände (session_data,
+    driver_data) liefern None - Green -> Yellow -> Green ist kein Duplikat.
+    """
+    event_data = data.get('event_data')
+    if isinstance(event_data, dict) and 'lap' in event_data:
+        return ('event', event_data.get('controller_id'), event_data.get('lap'), data.get('time'))
+    lap_data = data.get('lap_data')
+    if isinstance(lap_data, dict):
+        driver_id = str((data.get('driver_data') or {}).get('id', 'unknown'))
+        return ('lap', driver_id, lap_data.get('lap_number'), lap_data.get('lap_time'))
+    return None
+
+
+def is_low_priority(data, low_priority_events=LOW_PRIORITY_EVENTS):
+    """Runden und Session-Status sind wichtig, reine Positions-Updates kommen ohnehin ständig neu"""
+    if data.get('event_type') in low_priority_events:
+        return True
+    if 'lap_data' in data or 'session_data' in data:
+        return False
+    event_data = data.get('event_data')
+    return not (isinstance(event_data, dict) and 'lap' in event_data)
+
+
+class SeenSet:
+    """Zuletzt gesehene Keys mit Zeitfenster und Obergrenze (älteste fliegen zuerst raus)"""
+
+    def __init__(self, window=DEDUP_WINDOW, maxsize=DEDUP_SIZE, clock=time.monotonic):
+        self.window = window
+        self.maxsize = maxsize
+        self.clock = clock
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, key):
+        """Merkt sich den Key, liefert False wenn er im Fenster schon einmal vorkam"""
+        now = self.clock()
+        with self._lock:
+            # Einfügereihenfolge = Zeitreihenfolge, abgelaufene liegen vorne
+            while self._seen:
+                oldest_key, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.window:
+                    break
+                del self._seen[oldest_key]
+            if key in self._seen:
+                return False
+            self._seen[key] = now
+            while len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+
+class RateLimiter:
+    """Token Bucket pro Quelle, nur die zuletzt aktiven Quellen werden vorgehalten"""
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, max_sources=1024, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_sources = max_sources
+        self.clock = clock
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, source):
+        """Verbraucht ein Token, liefert 0 wenn erlaubt, sonst die Wartezeit in Sekunden"""
+        if self.rate <= 0:
+            return 0
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(source, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[source] = (tokens - 1 if not wait else tokens, now)
+            if len(self._buckets) > self.max_sources:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class IngestGuard:
+    """Vorfilter für /api/smartrace: Rate Limit, Duplikate und Load Shedding"""
+
+    def __init__(self, seen=None, limiter=None, shed_threshold=SHED_THRESHOLD):
+        self.seen = seen or SeenSet()
+        self.limiter = limiter or RateLimiter()
+        self.shed_threshold = shed_threshold
+        self.stats = {'accepted': 0, 'duplicates': 0, 'rate_limited': 0, 'shed': 0}
+
+    def check_rate(self, source):
+        wait = self.limiter.allow(source)
+        if wait:
+            self.stats['rate_limited'] += 1
+        return wait
+
+    def is_duplicate(self, key):
+        """Merkt sich den Key eines neuen Events, True wenn er im Fenster schon vorkam"""
+        if key is None:
+            return False
+        if not self.seen.add(key):
+            self.stats['duplicates'] += 1
+            return True
+        return False
+
+    def should_shed(self, data, queue_size):
+        if self.shed_threshold and queue_size >= self.shed_threshold and is_low_priority(data):
+            self.stats['shed'] += 1
+            return True
+        self.stats['accepted'] += 1
+        return False
+
+    def forget(self, key):
+        """Fehlgeschlagene Events dürfen erneut gesendet werden"""
+        if key is not None:
+            self.seen.discard(key)
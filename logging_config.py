@@ -0,0 +1,150 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import atexit
+import datetime
+import itertools
+
+# Standard-Attribute eines LogRecord, alles andere kommt über `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class LazyJson:
+    """Serialisiert ein Objekt erst, wenn der Log-Eintrag wirklich ausgegeben wird"""
+
+    def __init__(self, obj, indent=None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.obj, indent=self.indent, default=str, ensure_ascii=False)
+
+
+class JsonFormatter(logging.Formatter):
+    """Eine JSON-Zeile pro Log-Eintrag"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Lässt von Einträgen mit extra={'sample': <key>} nur jeden n-ten pro Key durch"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.counters = {}
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        if not self.every:
+            return False
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = itertools.count()
+        return next(counter) % self.every == 0
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Reicht Einträge an den Hintergrund-Thread weiter, verwirft sie statt zu blockieren"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def handle(self, record):
+        # Ohne Handler-Lock: die Queue ist selbst threadsicher, und unter eventlet wäre das Lock
+        # grün und dürfte nicht aus OS-Threads (tpool) genommen werden
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def prepare(self, record):
+        # Nur die Nachricht auflösen, formatiert wird im Listener-Thread
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec):
+    """Parst LOG_LEVELS im Format 'smartrace.database=DEBUG,engineio=WARNING'"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class ThreadQueueListener(logging.handlers.QueueListener):
+    """QueueListener mit wählbarer Thread-Klasse (echter OS-Thread auch unter eventlet)"""
+
+    def __init__(self, log_queue, *handlers, thread_class=threading.Thread, **kwargs):
+        super().__init__(log_queue, *handlers, **kwargs)
+        self.thread_class = thread_class
+
+    def start(self):
+        self._thread = self.thread_class(target=self._monitor, name='log-listener', daemon=True)
+        self._thread.start()
+
+
+def setup_logging(queue_class=queue.Queue, thread_class=threading.Thread):
+    """Konfiguriert Root-Logger mit Queue-Handler und Hintergrund-Listener"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue_class(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', 0.1))))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    # Werkzeug/Engine.IO loggen jeden Request, das gehört nicht auf INFO
+    levels = {'werkzeug': 'WARNING', 'engineio': 'WARNING', 'socketio': 'WARNING', 'geventwebsocket': 'WARNING'}
+    levels.update(parse_levels(os.getenv('LOG_LEVELS', '')))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = ThreadQueueListener(log_queue, stream_handler, thread_class=thread_class,
+                                    respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
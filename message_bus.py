@@ -0,0 +1,173 @@
+import os
+import glob
+import uuid
+import queue
+import errno
+import atexit
+import socket
+import threading
+import logging
+
+import socketio
+from socketio import packet
+
+import serializer
+
+logger = logging.getLogger('smartrace.bus')
+
+# Obergrenze für ein Datagramm auf dem Unix-Socket-Bus
+MAX_DATAGRAM = 1 << 20
+
+
+class EncodedPacket:
+    """Einmal kodiertes Paket, das Server._send_packet für jeden Client wiederverwendet"""
+
+    def __init__(self, pkt):
+        self.packet_type = pkt.packet_type
+        self.namespace = pkt.namespace
+        self.data = pkt.data
+        self._encoded = pkt.encode()
+
+    def encode(self):
+        return self._encoded
+
+
+class BroadcastManager(socketio.BaseManager):
+    """Kodiert ein Emit an einen Raum einmal statt einmal pro Client"""
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        # Acks brauchen eine eigene Paket-ID pro Client
+        if callback is not None or namespace not in self.rooms or room not in self.rooms[namespace]:
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, **kwargs)
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        packet_class = getattr(self.server, 'packet_class', packet.Packet)
+        pkt = EncodedPacket(packet_class(packet.EVENT, namespace=namespace, data=[event] + data))
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid not in skip_sid:
+                self.server._send_packet(eio_sid, pkt)
+
+
+class BusListenerMixin:
+    """Ruft registrierte Listener für jedes Emit auf, das über den Bus hereinkommt"""
+
+    def add_listener(self, func):
+        """func(event, data, room, local) - local ist True für eigene Emits"""
+        if not hasattr(self, '_listeners'):
+            self._listeners = []
+        self._listeners.append(func)
+
+    def _handle_emit(self, message):
+        local = message.get('host_id') == self.host_id
+        for func in getattr(self, '_listeners', []):
+            try:
+                func(message['event'], message['data'], message.get('room'), local)
+            except Exception as e:
+                logger.exception("❌ Bus listener failed: %s", e)
+        super()._handle_emit(message)
+
+
+class InProcessManager(BusListenerMixin, socketio.PubSubManager, BroadcastManager):
+    """Pub/Sub innerhalb eines Prozesses - für Tests und Einzelbetrieb"""
+    name = 'memory'
+
+    _subscribers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = queue.Queue()
+        if not write_only:
+            with self._lock:
+                self._subscribers.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        for inbox in list(self._subscribers.get(self.channel, [])):
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+class UnixSocketManager(BusListenerMixin, socketio.PubSubManager, BroadcastManager):
+    """Pub/Sub über Unix-Datagram-Sockets, ein Socket pro Worker im gemeinsamen Verzeichnis"""
+    name = 'unix'
+
+    def __init__(self, url='unix:///tmp/smartrace-bus', channel='socketio', write_only=False, logger=None):
+        self.directory = os.path.join(url[len('unix://'):], channel)
+        os.makedirs(self.directory, exist_ok=True)
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Ein Worker, der (noch) nicht liest, darf den Sender nicht blockieren
+        self._send_sock.setblocking(False)
+        self._recv_sock = None
+        self.dropped = 0
+        if not write_only:
+            self._path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+            self._recv_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MAX_DATAGRAM)
+            self._recv_sock.bind(self._path)
+            atexit.register(self._unlink)
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _unlink(self):
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    def _publish(self, data):
+        payload = serializer.dumpb(data)
+        for path in glob.glob(os.path.join(self.directory, '*.sock')):
+            try:
+                self._send_sock.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker ist weg, verwaisten Socket aufräumen
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                    # Empfangspuffer voll - Nachricht für diesen Worker verwerfen
+                    self.dropped += 1
+                    logger.info("⚠️ Bus receiver %s is full, message dropped", path,
+                                extra={'sample': 'bus_dropped'})
+                    continue
+                logger.warning("⚠️ Bus publish to %s failed: %s", path, e)
+
+    def _listen(self):
+        while True:
+            payload = self._recv_sock.recv(MAX_DATAGRAM)
+            try:
+                yield serializer.loads(payload)
+            except ValueError:
+                logger.warning("⚠️ Invalid bus message dropped")
+
+
+class RedisManager(BusListenerMixin, socketio.RedisManager, BroadcastManager):
+    """Redis Pub/Sub für mehrere Container/Hosts"""
+
+
+class KombuManager(BusListenerMixin, socketio.KombuManager, BroadcastManager):
+    """AMQP & Co. über kombu"""
+
+
+def create_client_manager(url, channel='socketio', write_only=False):
+    """Erzeugt den Socket.IO Client Manager für SOCKETIO_MESSAGE_QUEUE (leer = nur lokal)"""
+    if not url:
+        return BroadcastManager()
+    if url.startswith('memory://'):
+        return InProcessManager(channel=channel, write_only=write_only)
+    if url.startswith('unix://'):
+        return UnixSocketManager(url, channel=channel, write_only=write_only)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisManager(url, channel=channel, write_only=write_only)
+    return KombuManager(url, channel=channel, write_only=write_only)
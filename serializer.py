@@ -0,0 +1,60 @@
+import os
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson ist deutlich schneller, fehlt es (oder JSON_BACKEND=json), bleibt es bei der Standardbibliothek
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if os.getenv('JSON_BACKEND', '').lower() == 'json':
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+
+def dumpb(obj, indent=None, sort_keys=False, default=None, **kwargs):
+    """Serialisiert nach UTF-8 Bytes, weitere json.dumps Parameter (separators, ...) gelten nur für den Fallback"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if default is not None:
+            # datetime/date über default formatieren lassen (Flask: HTTP-Date) wie beim json-Fallback
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # z.B. Integer > 64 Bit, die Standardbibliothek kann das
+            pass
+    return json.dumps(obj, indent=indent, sort_keys=sort_keys, default=default, **kwargs).encode('utf-8')
+
+
+def dumps(obj, **kwargs):
+    """Wie json.dumps, liefert einen String (Socket.IO erwartet dumps/loads wie das json Modul)"""
+    if orjson is None:
+        return json.dumps(obj, **kwargs)
+    return dumpb(obj, **kwargs).decode('utf-8')
+
+
+def loads(data, **kwargs):
+    if orjson is None or kwargs:
+        return json.loads(data, **kwargs)
+    return orjson.loads(data)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON-Provider (jsonify, request.get_json) über dumps/loads dieses Moduls"""
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return loads(s, **kwargs)
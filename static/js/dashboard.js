@@ -12,9 +12,13 @@
         constructor() {
             this.socket = null;
             this.lapHistory = {};
+            this.drivers = {};
             this.carDatabase = {};
             this.showTop6Only = false;
             this.isInitialized = false;
+            // Kompaktes Wire-Format (Arrays + ms), mit ?format=json abschaltbar
+            this.wireFormat = new URLSearchParams(window.location.search).get('format') === 'json' ? 'json' : 'compact';
+            this.schema = null;
         }
 
         async init() {
@@ -66,6 +70,11 @@
             this.socket.on('connect', () => {
                 console.log('✅ WebSocket connected');
                 this.updateConnectionStatus(true);
+                // Nur die Topics abonnieren, die das Dashboard auch anzeigt
+                this.socket.emit('subscribe', {
+                    topics: ['leaderboard', 'session', 'laps'],
+                    format: this.wireFormat
+                });
             });
 
             this.socket.on('disconnect', (reason) => {
@@ -88,7 +97,31 @@
                 }
             });
 
-            this.socket.on('lap_update', (lapData) => {
+            this.socket.on('schema', (schema) => {
+                console.log('📐 Wire schema received, version', schema.version);
+                this.schema = schema;
+            });
+
+            this.socket.on('leaderboard_update', (drivers) => {
+                console.log('📊 Leaderboard received:', drivers);
+                this.drivers = this.decodeDrivers(drivers);
+                this.updateDriversTable(this.drivers);
+            });
+
+            // Nur geänderte Fahrer (Rundenzeiten, Positionen, Gaps)
+            this.socket.on('leaderboard_changes', (drivers) => {
+                console.log('📊 Leaderboard changes received:', drivers);
+                this.drivers = { ...this.drivers, ...this.decodeDrivers(drivers) };
+                this.updateDriversTable(this.drivers);
+            });
+
+            this.socket.on('session_update', (sessionInfo) => {
+                console.log('📊 Session info received:', sessionInfo);
+                this.updateSessionInfo(this.decodeRow('session', sessionInfo));
+            });
+
+            this.socket.on('lap_update', (message) => {
+                const lapData = this.decodeLap(message);
                 console.log('⏱️ Lap data received:', lapData);
                 this.addLapToHistory(lapData);
                 this.updateLaptimeMonitor();
@@ -100,6 +133,40 @@
             });
         }
 
+        // Kompaktes Format: Positions-Array -> Objekt, Millisekunden -> Sekunden für formatTime()
+        decodeRow(kind, row) {
+            if (!this.schema || !Array.isArray(row)) {
+                return row;
+            }
+            const obj = {};
+            this.schema.fields[kind].forEach((field, index) => {
+                const value = row[index];
+                obj[field] = (typeof value === 'number' && this.schema.time_fields.includes(field)) ?
+                    value / 1000 : value;
+            });
+            return obj;
+        }
+
+        decodeDrivers(drivers) {
+            if (!Array.isArray(drivers)) {
+                return drivers;
+            }
+            const decoded = {};
+            drivers.forEach(row => {
+                const driver = this.decodeRow('leaderboard', row);
+                decoded[driver.driver_id] = driver;
+            });
+            return decoded;
+        }
+
+        decodeLap(message) {
+            if (!Array.isArray(message)) {
+                return message;
+            }
+            const { driver_id, ...lapData } = this.decodeRow('lap', message);
+            return { driver_id: driver_id, lap_data: lapData };
+        }
+
         updateConnectionStatus(connected) {
             const statusElement = document.getElementById('connection-status');
             if (statusElement) {
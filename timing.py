@@ -0,0 +1,240 @@
+import bisect
+
+from wire_format import parse_time_ms
+
+INF = float('inf')
+
+
+def format_gap(ms):
+    """Millisekunden als '+1.234', None bleibt None"""
+    if ms is None:
+        return None
+    return f'{"+" if ms >= 0 else "-"}{abs(ms) / 1000:.3f}'
+
+
+def lap_count(value):
+    """Rundenzahl als int, SmartRace schickt sie teils als String, fehlend/ungültig = 0"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def session_mode(session_type):
+    """Rennen werten nach Runden + Gesamtzeit, alles andere (Training, Qualifying) nach Bestzeit"""
+    return 'race' if 'race' in str(session_type or '').lower() else 'best_lap'
+
+
+class Leaderboard:
+    """Sortierte Rangliste mit inkrementeller Neuberechnung von Position, Gap und Intervall
+
+    Die Schlüssel liegen sortiert in einer Liste, ein Update sucht alte und neue Position
+    per bisect und berechnet nur den Bereich dazwischen neu. Nur wenn sich an der Spitze
+    etwas ändert, ändern sich die Gaps aller Fahrer.
+    """
+
+    def __init__(self, mode='best_lap'):
+        self.mode = mode
+        self._keys = []
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _sort_key(self, driver_id, entry):
+        if self.mode == 'race':
+            total_ms = entry['total_ms']
+            return (-entry['laps'], INF if total_ms is None else total_ms, driver_id)
+        best_ms = entry['best_ms']
+        return (INF if best_ms is None else best_ms, driver_id)
+
+    def _gap(self, entry, ahead):
+        if self.mode == 'race':
+            laps_behind = ahead['laps'] - entry['laps']
+            if laps_behind > 0:
+                return f'+{laps_behind} Lap{"s" if laps_behind > 1 else ""}'
+            if entry['total_ms'] is None or ahead['total_ms'] is None:
+                return None
+            return format_gap(entry['total_ms'] - ahead['total_ms'])
+        if entry['best_ms'] is None or ahead['best_ms'] is None:
+            return None
+        return format_gap(entry['best_ms'] - ahead['best_ms'])
+
+    def _refresh(self, lo, hi):
+        """Berechnet Position/Gap/Intervall für Index lo..hi, liefert nur die geänderten"""
+        changes = []
+        leader = self._entries[self._keys[0][-1]]
+        for index in range(lo, hi + 1):
+            driver_id = self._keys[index][-1]
+            entry = self._entries[driver_id]
+            if index == 0:
+                values = (1, None, None)
+            else:
+                ahead = self._entries[self._keys[index - 1][-1]]
+                values = (index + 1, self._gap(entry, leader), self._gap(entry, ahead))
+            if values != (entry['position'], entry['gap'], entry['interval']):
+                entry['position'], entry['gap'], entry['interval'] = values
+                changes.append(self.standing(driver_id))
+        return changes
+
+    def update(self, driver_id, laps=None, total_time=None, best_lap=None):
+        """Übernimmt neue Werte eines Fahrers und liefert die geänderten Platzierungen"""
+        # Neuen Schlüssel komplett berechnen, bevor _keys angefasst wird
+        values = {'laps': lap_count(laps), 'total_ms': parse_time_ms(total_time), 'best_ms': parse_time_ms(best_lap)}
+        key = self._sort_key(driver_id, values)
+
+        entry = self._entries.get(driver_id)
+        old_index = None
+        if entry is None:
+            entry = self._entries[driver_id] = {'position': None, 'gap': None, 'interval': None}
+        else:
+            old_index = bisect.bisect_left(self._keys, entry['key'])
+            del self._keys[old_index]
+
+        entry.update(values, key=key)
+        new_index = bisect.bisect_left(self._keys, key)
+        self._keys.insert(new_index, key)
+
+        last = len(self._keys) - 1
+        if old_index is None or new_index == 0 or old_index == 0:
+            # Neuer Fahrer schiebt alle dahinter nach hinten, neue Spitze ändert alle Gaps
+            lo, hi = (0 if new_index == 0 or old_index == 0 else new_index), last
+        else:
+            # +1 für das Intervall des Fahrers direkt dahinter
+            lo, hi = min(old_index, new_index), min(max(old_index, new_index) + 1, last)
+        return self._refresh(lo, hi)
+
+    def remove(self, driver_id):
+        """Nimmt einen Fahrer aus der Wertung"""
+        entry = self._entries.pop(driver_id, None)
+        if entry is None:
+            return []
+        index = bisect.bisect_left(self._keys, entry['key'])
+        del self._keys[index]
+        if not self._keys:
+            return []
+        return self._refresh(index, len(self._keys) - 1)
+
+    def set_mode(self, mode):
+        """Wechsel zwischen Rennen und Bestzeit-Wertung sortiert komplett neu"""
+        if mode == self.mode:
+            return []
+        self.mode = mode
+        for driver_id, entry in self._entries.items():
+            entry['key'] = self._sort_key(driver_id, entry)
+        self._keys = sorted(entry['key'] for entry in self._entries.values())
+        return self._refresh(0, len(self._keys) - 1) if self._keys else []
+
+    def standing(self, driver_id):
+        entry = self._entries[driver_id]
+        return {
+            'driver_id': driver_id,
+            'position': entry['position'],
+            'gap': entry['gap'],
+            'interval': entry['interval']
+        }
+
+    def order(self):
+        """Fahrer-IDs in Reihenfolge der Platzierung"""
+        return [key[-1] for key in self._keys]
+
+
+class SectorTracker:
+    """Theoretische Bestzeit (Summe der besten Sektoren) pro Fahrer und gesamt
+
+    Wird pro Runde inkrementell nachgeführt, der Snapshot für API und Socket.IO wird nur
+    nach einer Änderung neu aufgebaut und sonst aus dem Speicher ausgeliefert.
+    """
+
+    def __init__(self, sectors=3):
+        self.sectors = sectors
+        self.version = 0
+        self._drivers = {}
+        self._overall = [None] * sectors
+        self._snapshot = None
+
+    def record_lap(self, driver_id, sector_times, pb_flags=()):
+        """Verarbeitet die Sektorzeiten einer Runde, liefert True wenn sich etwas geändert hat"""
+        times = [parse_time_ms(value) for value in list(sector_times)[:self.sectors]]
+        times += [None] * (self.sectors - len(times))
+        if all(value is None for value in times):
+            return False
+
+        state = self._drivers.get(driver_id)
+        if state is None:
+            state = self._drivers[driver_id] = {
+                'best': [None] * self.sectors,
+                'best_lap_sectors': None,
+                'streaks': [0] * self.sectors,
+                'longest_streaks': [0] * self.sectors
+            }
+
+        best = state['best']
+        for i, value in enumerate(times):
+            if value is None:
+                continue
+            # SmartRace liefert sector_N_pb, ohne Flag zählt eine neue eigene Bestzeit
+            flag = pb_flags[i] if i < len(pb_flags) else None
+            is_pb = bool(flag) if flag is not None else (best[i] is None or value < best[i])
+            state['streaks'][i] = state['streaks'][i] + 1 if is_pb else 0
+            state['longest_streaks'][i] = max(state['longest_streaks'][i], state['streaks'][i])
+            if best[i] is None or value < best[i]:
+                best[i] = value
+            if self._overall[i] is None or value < self._overall[i][0]:
+                self._overall[i] = (value, driver_id)
+
+        if None not in times:
+            best_lap = state['best_lap_sectors']
+            if best_lap is None or sum(times) < sum(best_lap):
+                state['best_lap_sectors'] = times
+
+        self.version += 1
+        self._snapshot = None
+        return True
+
+    def _driver_entry(self, state):
+        best = state['best']
+        best_lap = state['best_lap_sectors']
+        ideal = sum(best) if None not in best else None
+        return {
+            'ideal_lap': ideal,
+            'best_lap': sum(best_lap) if best_lap else None,
+            'best_sectors': list(best),
+            # Zeitverlust der besten Runde je Sektor gegenüber dem eigenen besten Sektor
+            'lost_per_sector': [lap - sector for lap, sector in zip(best_lap, best)] if best_lap else None,
+            'sector_pb_streaks': list(state['streaks']),
+            'longest_sector_pb_streaks': list(state['longest_streaks'])
+        }
+
+    def _overall_entry(self):
+        complete = None not in self._overall
+        return {
+            'ideal_lap': sum(best[0] for best in self._overall) if complete else None,
+            'sectors': [{'time': best[0], 'driver_id': best[1]} if best else None for best in self._overall]
+        }
+
+    def snapshot(self):
+        """Kompletter Stand für /api/ideal-lap und neue Abonnenten"""
+        if self._snapshot is None:
+            self._snapshot = {
+                'version': self.version,
+                'overall': self._overall_entry(),
+                'drivers': {driver_id: self._driver_entry(state) for driver_id, state in self._drivers.items()}
+            }
+        return self._snapshot
+
+    def driver_update(self, driver_id):
+        """Änderung eines Fahrers für den Socket.IO Push"""
+        snapshot = self.snapshot()
+        return {
+            'version': snapshot['version'],
+            'overall': snapshot['overall'],
+            'drivers': {driver_id: snapshot['drivers'][driver_id]}
+        }
+
+    def merge_update(self, update):
+        """Übernimmt ein Update eines anderen Workers (Viewer-Worker rechnen nicht selbst)"""
+        snapshot = self.snapshot()
+        snapshot['version'] = update['version']
+        snapshot['overall'] = update['overall']
+        snapshot['drivers'].update(update['drivers'])
@@ -0,0 +1,83 @@
+import re
+
+# Kompaktes Socket.IO Format: Positions-Arrays statt Dicts, Zeiten als Integer-Millisekunden.
+# Clients bekommen das Schema beim Subscribe ('schema' Event) und dekodieren selbst.
+SCHEMA_VERSION = 2
+COMPACT_SUFFIX = '#compact'
+
+SCHEMAS = {
+    'leaderboard': ['driver_id', 'name', 'car_number', 'position', 'best_lap', 'last_lap',
+                    'total_laps', 'total_time', 'gap', 'interval', 'status'],
+    'lap': ['driver_id', 'lap_number', 'lap_time', 'sector_1', 'sector_2', 'sector_3', 'timestamp'],
+    'session': ['session_type', 'total_time', 'total_laps', 'current_lap', 'session_status',
+                'flag_status', 'session_start', 'session_name']
+}
+
+TIME_FIELDS = ('best_lap', 'last_lap', 'total_time', 'gap', 'interval',
+               'lap_time', 'sector_1', 'sector_2', 'sector_3')
+
+_TIME_PATTERN = re.compile(r'^([+-])?(?:(\d+):)?(?:(\d+):)?(\d+(?:\.\d+)?)s?$')
+
+
+def schema_message():
+    """Payload des 'schema' Events für den Handshake"""
+    return {
+        'version': SCHEMA_VERSION,
+        'fields': SCHEMAS,
+        'time_fields': TIME_FIELDS,
+        'time_unit': 'ms'
+    }
+
+
+def compact_room(topic):
+    return f'{topic}{COMPACT_SUFFIX}'
+
+
+def parse_time_ms(value):
+    """Wandelt '1:23.456', '0:12.3', '83.456' oder Sekunden (float) in Millisekunden um
+
+    Integer gelten bereits als Millisekunden (wie laptime_raw von SmartRace).
+    Nicht parsebare Werte (z.B. '+1 Lap') ergeben None.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return round(value * 1000)
+    match = _TIME_PATTERN.match(str(value).strip())
+    if not match:
+        return None
+    sign, first, second, seconds = match.groups()
+    if second is not None:
+        total = int(first) * 3600 + int(second) * 60 + float(seconds)
+    elif first is not None:
+        total = int(first) * 60 + float(seconds)
+    else:
+        total = float(seconds)
+    ms = round(total * 1000)
+    return -ms if sign == '-' else ms
+
+
+def encode_time(value):
+    """Zeit als Millisekunden, nicht parsebare Werte bleiben unverändert"""
+    ms = parse_time_ms(value)
+    return value if ms is None else ms
+
+
+def _encode_row(kind, values):
+    return [encode_time(values.get(field)) if field in TIME_FIELDS else values.get(field)
+            for field in SCHEMAS[kind]]
+
+
+def encode_drivers(drivers):
+    return [_encode_row('leaderboard', dict(driver, driver_id=driver_id))
+            for driver_id, driver in drivers.items()]
+
+
+def encode_lap(driver_id, lap_info):
+    return _encode_row('lap', dict(lap_info, driver_id=driver_id))
+
+
+def encode_session(session_info):
+    return _encode_row('session', session_info)